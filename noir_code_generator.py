@@ -19,8 +19,10 @@ Inputs:
             "b2": [layer_2_biases],
             ...
         }
-    - (Optional) A JSON file containing test samples, structured with 'inputX' and 'outputX' keys,
+    - (Optional) A JSON file containing test samples, structured with 'inX' and 'outX' keys,
       where X represents the sample number.
+    - Files exported with the older 'lX_weights'/'lX_biases' and 'inputX'/'outputX' keys
+      can be used by selecting the 'legacy' key scheme.
 
 Outputs:
     - A Noir source code file ('main.nr') that illustrates the given neural network.
@@ -33,6 +35,12 @@ Usage:
     --save_path: Destination path to save the generated 'main.nr'.
     --model_parameters: Path to the JSON file detailing the model parameters.
     --test_samples: (Optional) Path to the JSON file containing the test samples.
+    --key_scheme: (Optional) Naming of the JSON keys, 'short' (default) or 'legacy'.
+    --cache: (Optional) Reuse the program generated earlier for the same inputs, if any.
+      Programs are cached in '~/.cache/noir-ml', which keeps the 16 most recently used.
+    --no_tests: (Optional) Skip the test samples, even if --test_samples is given.
+    --compress: (Optional) Write the program gzip-compressed to '<save_path>.gz', for tooling
+      that unpacks it before compiling.
 
 Example:
     python noir_program_generator.py --save_path src/main.nr --model_parameters model_parameters.json --test_samples test_samples.json
@@ -51,54 +59,544 @@ Code Generation Process:
 Note:
     The script leverages the 'noir_ml' library within Noir to utilize functions like `fc`,
     `relu`, and `arg_max` for the neural network computations.
+    The module is fully type annotated and can be compiled with `mypyc noir_code_generator.py`
+    when `generate_nn_code` is called repeatedly from Python; the resulting extension module
+    takes precedence over the source file on import.
 """
 
+import re
 import json
+import os
+import io
+import gzip
+import shutil
+import hashlib
 import argparse
+from pathlib import Path
+from contextlib import contextmanager
+from dataclasses import dataclass
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Set, TextIO, Tuple, Union
 
+try:
+    import ijson  # type: ignore[import-untyped]
+except ImportError:  # fall back to loading the whole file with json
+    ijson = None
 
-def generate_nn_code(save_path, model_parameters_file, test_samples_file=None):
-    # Read the model_parameters
-    with open(model_parameters_file, 'r') as f:
-        model_parameters = json.load(f)
-
-    idx = 1
-    model_str = ""
-    while f'w{idx}' in model_parameters and f'b{idx}' in model_parameters:
-        model_str += f"global w{idx}: [Field; {len(model_parameters[f'w{idx}'])}] = {model_parameters[f'w{idx}']};\n"
-        model_str += f"global b{idx}: [Field; {len(model_parameters[f'b{idx}'])}] = {model_parameters[f'b{idx}']};\n\n"
-        idx += 1
-
-    # Calculate the input dimension from w1 and b1
-    input_dim = len(model_parameters['w1']
-                    ) // len(model_parameters['b1'])
-
-    # Read the test_samples
-    if test_samples_file is not None:
-        with open(test_samples_file, 'r') as f:
-            test_samples = json.load(f)
-
-        test_str = "\n////////////////////\n//     TESTS      //\n////////////////////\n"
-        for i in range(1, len(test_samples) // 2 + 1):
-            test_str += f"#[test]\nfn test_main_{i:03}() {{\n  let sample = {test_samples[f'in{i}']};\n  assert(main(sample) == {test_samples[f'out{i}']});\n}}\n\n"
-
-    # Building the main function logic based on the number of layers
-    main_logic = "  let output = input;\n"  # initialize
-    for i in range(1, idx):
-        if i != idx - 1:  # if it's not the last layer
-            main_logic += f"  let output = relu(fc(output, w{i}, b{i}));\n"
-        else:  # if it's the last layer
-            main_logic += f"  let output = arg_max(fc(output, w{i}, b{i}));\n"
-
-    # Write the content to main.nr
-    with open(save_path, 'w') as f:
-        f.write(
+
+# Bump whenever the generated code changes, so that cached programs are not reused
+GENERATOR_VERSION = '5'
+
+# Generated programs are cached here when requested, keyed by a hash of the inputs. Only the
+# most recently used entries are kept.
+CACHE_DIR = Path.home() / '.cache' / 'noir-ml'
+CACHE_MAX_ENTRIES = 16
+
+
+@dataclass(frozen=True, slots=True)
+class KeyScheme:
+    # Key templates used in the JSON files, '{}' is replaced by the layer/sample index
+    weights: str = 'w{}'
+    biases: str = 'b{}'
+    input: str = 'in{}'
+    output: str = 'out{}'
+
+
+# Keys as documented in the README: 'wX'/'bX' and 'inX'/'outX'
+SHORT_SCHEME = KeyScheme()
+# Keys of older exports: 'lX_weights'/'lX_biases' and 'inputX'/'outputX'
+LEGACY_SCHEME = KeyScheme(weights='l{}_weights', biases='l{}_biases',
+                          input='input{}', output='output{}')
+
+KEY_SCHEMES = {'short': SHORT_SCHEME, 'legacy': LEGACY_SCHEME}
+
+
+def _key_regex(template: str) -> str:
+    prefix, suffix = template.split('{}')
+    # Indices are written in ASCII without leading zeros, so each layer has a single key
+    return re.escape(prefix) + r'([1-9][0-9]*)' + re.escape(suffix)
+
+
+@lru_cache(maxsize=None)
+def _key_pair_pattern(first: str, second: str) -> re.Pattern:
+    # Matches a key of the first template (group 1 = index) or of the second (group 2 = index)
+    return re.compile(f"(?:{_key_regex(first)}|{_key_regex(second)})$")
+
+
+# Template of the Noir test emitted for each test sample
+_TEST_TEMPLATE = "#[test]\nfn test_main_{i:03}() {{\n  let sample = {sample};\n  assert(main(sample) == {expected});\n}}\n\n"
+
+# Number of array elements formatted per write when emitting globals
+_EMIT_CHUNK_SIZE = 8192
+
+
+def _emit_field_array(f: TextIO, name: str, values: Union[list, '_RawArray']) -> None:
+    # Write `global name: [Field; n] = [...];` without building the repr of the whole list.
+    # Each chunk is formatted by the list repr, which converts the elements in C and is faster
+    # than str.join over map(str, ...) or numpy's array2string/astype(str)/char.mod.
+    write = f.write
+    n = len(values)
+    write(f"global {name}: [Field; {n}] = [")
+    if isinstance(values, _RawArray):
+        write(values.text)
+        write("];\n")
+        return
+    for start in range(0, n, _EMIT_CHUNK_SIZE):
+        if start:
+            write(", ")
+        write(str(values[start:start + _EMIT_CHUNK_SIZE])[1:-1])
+    write("];\n")
+
+
+def _layer_line(i: int, last: bool) -> str:
+    # ReLU on the hidden layers, arg_max on the output layer
+    op = "arg_max" if last else "relu"
+    return f"  let output = {op}(fc(output, w{i}, b{i}));\n"
+
+
+# Tokens of the incremental JSON scanner: whitespace, a complete string, the end of a number or
+# literal, and the characters that open or close a nested value or a string
+_JSON_WHITESPACE = re.compile(rb'[ \t\n\r]+')
+_JSON_STRING = re.compile(rb'"(?:[^"\\]|\\.)*"')
+_JSON_SCALAR_END = re.compile(rb'[ \t\n\r,}\]]')
+_JSON_SPECIAL = re.compile(rb'[\[\]{}"]')
+
+# Number of bytes read from the parameters file at a time
+_READ_SIZE = 1 << 20
+
+# Maps the separators and whitespace of a flat array to ',' and the elements' characters to 'x'
+_ARRAY_CHAR_CLASSES = bytes(0x2c if c in b',[] \t\n\r' else 0x78 for c in range(256))
+
+
+@dataclass(frozen=True, slots=True)
+class _RawArray:
+    # Comma separated elements of a JSON array, as they appear in the file
+    text: str
+    n: int
+
+    def __len__(self) -> int:
+        return self.n
+
+
+def _strip_array_whitespace(text: bytes) -> Optional[bytes]:
+    # Drop the whitespace of a piece of a flat array's text, which ends at a ',' or at the closing
+    # ']'. Returns None if whitespace separates two elements' characters, as in '[1 2]': the piece
+    # then has more runs of element characters than elements. Empty elements are rejected later.
+    runs = text.translate(_ARRAY_CHAR_CLASSES).count(b',x') + (text[:1] not in b',[ \t\n\r')
+    if runs > text.count(b',') + text.endswith(b']'):
+        return None
+    return text.translate(None, b' \t\n\r')
+
+
+def _is_integer_list(body: bytes) -> bool:
+    # Whether a whitespace-free array body is a comma separated list of integers, checked with
+    # bytes operations that run in C. Non-integer numbers are left to json.loads. Leading zeros,
+    # which JSON does not allow, are accepted and copied as is.
+    if not body:
+        return True
+    return (not body.translate(None, b'-0123456789,')
+            and body[:1] != b',' and body[-1:] != b',' and b',,' not in body
+            and body[-1:] != b'-' and b'-,' not in body
+            and body.count(b'-') == body.count(b',-') + (body[:1] == b'-'))
+
+
+class _TopLevelScanner:
+    # Reads the members of the top-level JSON object of a file block by block. Flat arrays of
+    # integers are returned as _RawArray, copying the numbers' text instead of parsing and
+    # formatting them again; any other value is decoded with json.loads.
+
+    def __init__(self, f: BinaryIO, path: str) -> None:
+        self.f = f
+        self.path = path
+        self.buf = b''
+        self.pos = 0
+
+    def _read_more(self) -> None:
+        # Drop the buffer before self.pos and append the next block
+        block = self.f.read(_READ_SIZE)
+        if not block:
+            raise ValueError(f"Unexpected end of JSON in {self.path}")
+        self.buf = self.buf[self.pos:] + block
+        self.pos = 0
+
+    def _peek(self) -> bytes:
+        # Skip whitespace and return the next character without consuming it
+        while True:
+            m = _JSON_WHITESPACE.match(self.buf, self.pos)
+            if m is not None:
+                self.pos = m.end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos:self.pos + 1]
+            self._read_more()
+
+    def _expect(self, char: bytes) -> None:
+        if self._peek() != char:
+            raise ValueError(f"Expected {char.decode()!r} at top level of {self.path}")
+        self.pos += 1
+
+    def _string(self) -> bytes:
+        while True:
+            m = _JSON_STRING.match(self.buf, self.pos)
+            if m is not None:
+                self.pos = m.end()
+                return m.group()
+            self._read_more()
+
+    def _scalar(self) -> Any:
+        while True:
+            m = _JSON_SCALAR_END.search(self.buf, self.pos)
+            if m is not None:
+                text = self.buf[self.pos:m.start()]
+                self.pos = m.start()
+                return json.loads(text)
+            self._read_more()
+
+    def _flat_piece(self, pieces: List[bytes], end: int) -> None:
+        # Append the text of a flat array up to end without its whitespace
+        piece = _strip_array_whitespace(self.buf[self.pos:end])
+        if piece is None:
+            raise ValueError(f"Missing comma between array elements in {self.path}")
+        pieces.append(piece)
+        self.pos = end
+
+    def _container(self) -> Any:
+        # Collect the text of an array or object, tracking the nesting depth and skipping strings
+        pieces: List[bytes] = []
+        depth = 0
+        flat = self.buf[self.pos] == 0x5b  # '[', only arrays can be copied as _RawArray
+        i = self.pos
+        while True:
+            if flat and depth == 1:
+                # Inside a flat array, jump to the next ']' if nothing opens before it
+                buf = self.buf
+                end = buf.find(b']', i)
+                stop = len(buf) if end < 0 else end
+                if buf.find(b'[', i, stop) < 0 and buf.find(b'{', i, stop) < 0 and buf.find(b'"', i, stop) < 0:
+                    # No strings so far, so whitespace can be dropped right away. Pieces end at a
+                    # comma, so that an element split by the end of a block is checked as a whole.
+                    if end >= 0:
+                        self._flat_piece(pieces, end + 1)
+                        break
+                    comma = buf.rfind(b',', self.pos)
+                    if comma >= 0:
+                        self._flat_piece(pieces, comma + 1)
+                    i = len(buf) - self.pos
+                    self._read_more()
+                    continue
+            m = _JSON_SPECIAL.search(self.buf, i)
+            if m is None:
+                pieces.append(self.buf[self.pos:])
+                self.pos = len(self.buf)
+                self._read_more()
+                i = 0
+                continue
+            j = m.start()
+            char = self.buf[j]
+            if char == 0x22:  # '"'
+                flat = False
+                string = _JSON_STRING.match(self.buf, j)
+                if string is None:
+                    # The string continues in the next block
+                    pieces.append(self.buf[self.pos:j])
+                    self.pos = j
+                    self._read_more()
+                    i = 0
+                    continue
+                i = string.end()
+                continue
+            if char == 0x5b or char == 0x7b:  # '[' or '{'
+                depth += 1
+                flat = flat and depth == 1
+            else:
+                depth -= 1
+            i = j + 1
+            if depth == 0:
+                pieces.append(self.buf[self.pos:i])
+                self.pos = i
+                break
+
+        text = b''.join(pieces)
+        del pieces
+        if flat:
+            body = text[1:-1].strip(b' \t\n\r')
+            del text
+            if _is_integer_list(body):
+                return _RawArray(body.replace(b',', b', ').decode('ascii'),
+                                 body.count(b',') + 1 if body else 0)
+            return json.loads(b'[' + body + b']')
+        return json.loads(text)
+
+    def _value(self) -> Any:
+        char = self._peek()
+        if char == b'[' or char == b'{':
+            return self._container()
+        if char == b'"':
+            return json.loads(self._string())
+        return self._scalar()
+
+    def _end(self) -> None:
+        # Consume the closing '}' and check that only whitespace follows it
+        self.pos += 1
+        while True:
+            m = _JSON_WHITESPACE.match(self.buf, self.pos)
+            if m is not None:
+                self.pos = m.end()
+            if self.pos < len(self.buf):
+                raise ValueError(f"Extra data after the top-level object of {self.path}")
+            block = self.f.read(_READ_SIZE)
+            if not block:
+                return
+            self.buf = block
+            self.pos = 0
+
+    def members(self) -> Iterator[Tuple[str, Any]]:
+        self._expect(b'{')
+        if self._peek() == b'}':
+            self._end()
+            return
+        while True:
+            if self._peek() != b'"':
+                raise ValueError(f"Expected a key at top level of {self.path}")
+            key = json.loads(self._string())
+            self._expect(b':')
+            yield key, self._value()
+            if self._peek() == b'}':
+                self._end()
+                return
+            self._expect(b',')
+
+
+def _iter_raw_arrays(path: str) -> Iterator[Tuple[str, Any]]:
+    # Yield the top-level (key, value) pairs of a JSON object, reading the file incrementally
+    with open(path, 'rb') as f:
+        yield from _TopLevelScanner(f, path).members()
+
+
+def _decimals_to_floats(value: Any) -> Any:
+    # ijson returns non-integer numbers as Decimal, convert them to the floats json.load returns
+    if isinstance(value, list):
+        return [_decimals_to_floats(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _decimals_to_floats(v) for k, v in value.items()}
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _iter_json_items(path: str) -> Iterator[Tuple[str, Any]]:
+    # Yield the top-level (key, value) pairs of a JSON object, streaming them if ijson is available
+    if ijson is not None:
+        with open(path, 'rb') as f:
+            # Without use_float, yajl keeps integers wider than 64 bits (Field elements) exact
+            for key, value in ijson.kvitems(f, ''):
+                yield key, _decimals_to_floats(value)
+    else:
+        with open(path, 'r') as f:
+            yield from _load_json_items(f, path)
+
+
+def _load_json_items(f: TextIO, path: str) -> List[Tuple[str, Any]]:
+    # The top-level (key, value) pairs of a JSON object, including duplicate keys, which a dict
+    # would merge. Objects are decoded innermost first, so the top-level one is the last.
+    last: List[List[Tuple[str, Any]]] = [[]]
+
+    def object_pairs(pairs: List[Tuple[str, Any]]) -> Dict[str, Any]:
+        last[0] = pairs
+        return dict(pairs)
+
+    if not isinstance(json.load(f, object_pairs_hook=object_pairs), dict):
+        raise ValueError(f"Expected a JSON object in {path}")
+    return last[0]
+
+
+def _cache_key(model_parameters_file: str, test_samples_file: Optional[str], scheme: KeyScheme) -> str:
+    # Hash everything the generated program depends on
+    h = hashlib.blake2b(digest_size=16)
+    for path in (model_parameters_file, test_samples_file):
+        h.update(b'\0')
+        if path is not None:
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    h.update(chunk)
+    h.update(repr(scheme).encode())
+    h.update(GENERATOR_VERSION.encode())
+    return h.hexdigest()
+
+
+def generate_nn_code(save_path: str, model_parameters_file: str, test_samples_file: Optional[str] = None,
+                     scheme: KeyScheme = SHORT_SCHEME, use_cache: bool = False, compress: bool = False) -> str:
+    # Returns the path of the generated program, which gets a '.gz' suffix when compressed
+    suffix = '.nr.gz' if compress else '.nr'
+    if compress:
+        save_path += '.gz'
+
+    if not use_cache:
+        _write_nn_code(save_path, model_parameters_file, test_samples_file, scheme, compress)
+        return save_path
+
+    cache_path = CACHE_DIR / f"{_cache_key(model_parameters_file, test_samples_file, scheme)}{suffix}"
+    try:
+        os.utime(cache_path)  # mark as recently used, so that it is evicted last
+        _copy_file(str(cache_path), save_path)
+        return save_path
+    except FileNotFoundError:  # not cached, or evicted by a concurrent run
+        pass
+
+    _write_nn_code(save_path, model_parameters_file, test_samples_file, scheme, compress)
+
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    _copy_file(save_path, str(cache_path))
+    _evict_cache()
+    return save_path
+
+
+def _copy_file(src: str, dst: str) -> None:
+    # Copy through a temporary file, so that a concurrent reader never sees a partial dst
+    tmp_path = f"{dst}.{os.getpid()}.tmp"
+    try:
+        shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, dst)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _evict_cache() -> None:
+    # Remove the least recently used programs beyond CACHE_MAX_ENTRIES
+    # Entries being written by other runs end in '.tmp' and are left alone
+    entries = []
+    for path in CACHE_DIR.iterdir():
+        if path.name.endswith(('.nr', '.nr.gz')):
+            try:
+                entries.append((path.stat().st_mtime, path))
+            except FileNotFoundError:  # evicted by a concurrent run
+                pass
+    entries.sort(reverse=True)
+    for _, path in entries[CACHE_MAX_ENTRIES:]:
+        path.unlink(missing_ok=True)
+
+
+@contextmanager
+def _open_output(path: str, compress: bool, name: str) -> Iterator[TextIO]:
+    # The generated code is ASCII, so the encoder is a copy; newline='' also skips the
+    # per-write newline translation on Windows
+    if not compress:
+        with open(path, 'w', buffering=1 << 20, encoding='ascii', newline='') as f:
+            yield f
+        return
+    # The gzip header records the final name without '.gz' rather than the temporary path, and no
+    # timestamp, so that the same program always compresses to the same bytes. Level 1: the digits
+    # of the weights compress well even at the fastest setting.
+    with open(path, 'wb') as raw, \
+            gzip.GzipFile(filename=name, mode='wb', compresslevel=1, fileobj=raw, mtime=0) as gz, \
+            io.TextIOWrapper(gz, encoding='ascii', newline='') as f:
+        yield f
+
+
+def _write_nn_code(save_path: str, model_parameters_file: str, test_samples_file: Optional[str],
+                   scheme: KeyScheme, compress: bool = False) -> None:
+    # Generate into a temporary file, so that a failure never leaves a truncated main.nr behind
+    tmp_path = f"{save_path}.{os.getpid()}.tmp"
+    try:
+        _write_nn_code_to(tmp_path, model_parameters_file, test_samples_file, scheme, compress,
+                          os.path.basename(save_path).removesuffix('.gz'))
+        os.replace(tmp_path, save_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _write_nn_code_to(save_path: str, model_parameters_file: str, test_samples_file: Optional[str],
+                      scheme: KeyScheme, compress: bool, name: str) -> None:
+    # Write the content to main.nr as it is generated
+    with _open_output(save_path, compress, name) as f:
+        write = f.write
+        write(
             "use dep::noir_ml::{layers::fc, activations::relu, utils::arg_max};\n\n")
-        f.write(model_str)
-        f.write(
-            f"fn main(input: [Field; {input_dim}]) -> pub Field {{\n{main_logic}  output\n}}\n")
+
+        # Emit a layer's globals as soon as its weights, its biases and all earlier layers have been
+        # read. Layers after a gap in the numbering are not part of the network and are not emitted.
+        pending_weights: Dict[int, Any] = {}
+        pending_biases: Dict[int, Any] = {}
+        seen_weights: Set[int] = set()
+        seen_biases: Set[int] = set()
+        num_layers = 0
+        input_dim = 0
+        match = _key_pair_pattern(scheme.weights, scheme.biases).match
+        for key, values in _iter_raw_arrays(model_parameters_file):
+            m = match(key)
+            if m is None:
+                continue
+            w_idx, b_idx = m.groups()
+            if w_idx is not None:
+                pending, seen, i = pending_weights, seen_weights, int(w_idx)
+            else:
+                pending, seen, i = pending_biases, seen_biases, int(b_idx)
+            if i in seen:
+                raise ValueError(f"Duplicate key '{key}' in {model_parameters_file}")
+            seen.add(i)
+            pending[i] = values
+
+            while num_layers + 1 in pending_weights and num_layers + 1 in pending_biases:
+                num_layers += 1
+                w = pending_weights.pop(num_layers)
+                b = pending_biases.pop(num_layers)
+                _emit_field_array(f, f"w{num_layers}", w)
+                _emit_field_array(f, f"b{num_layers}", b)
+                write("\n")
+                if num_layers == 1:
+                    # Calculate the input dimension from w1 and b1
+                    input_dim = len(w) // len(b)
+
+        if num_layers == 0:
+            raise ValueError(f"No weights and biases for layer 1 in {model_parameters_file}")
+
+        # Building the main function logic based on the number of layers
+        main_logic = "  let output = input;\n" + "".join(  # initialize
+            _layer_line(i, i == num_layers) for i in range(1, num_layers + 1))
+        write(f"fn main(input: [Field; {input_dim}]) -> pub Field {{\n{main_logic}  output\n}}\n")
+
+        # Stream the test_samples, emitting each test as soon as both halves of its pair are read
         if test_samples_file is not None:
-            f.write(test_str)
+            write("\n////////////////////\n//     TESTS      //\n////////////////////\n")
+            pending_inputs: Dict[int, Any] = {}
+            pending_outputs: Dict[int, Any] = {}
+            seen_inputs: Set[int] = set()
+            seen_outputs: Set[int] = set()
+            match = _key_pair_pattern(scheme.input, scheme.output).match
+            format_test = _TEST_TEMPLATE.format
+            for key, value in _iter_json_items(test_samples_file):
+                m = match(key)
+                if m is None:
+                    continue
+                in_idx, out_idx = m.groups()
+                if in_idx is not None:
+                    i = int(in_idx)
+                    if i in seen_inputs:
+                        raise ValueError(f"Duplicate key '{key}' in {test_samples_file}")
+                    seen_inputs.add(i)
+                    if i in pending_outputs:
+                        write(format_test(i=i, sample=value, expected=pending_outputs.pop(i)))
+                    else:
+                        pending_inputs[i] = value
+                else:
+                    i = int(out_idx)
+                    if i in seen_outputs:
+                        raise ValueError(f"Duplicate key '{key}' in {test_samples_file}")
+                    seen_outputs.add(i)
+                    if i in pending_inputs:
+                        write(format_test(i=i, sample=pending_inputs.pop(i), expected=value))
+                    else:
+                        pending_outputs[i] = value
+
+            # Every sample needs both its input and its output
+            missing = [scheme.output.format(i) for i in sorted(pending_inputs)]
+            missing += [scheme.input.format(i) for i in sorted(pending_outputs)]
+            if missing:
+                raise ValueError(f"Missing keys {', '.join(missing)} in {test_samples_file}")
 
 
 if __name__ == "__main__":
@@ -110,9 +608,23 @@ if __name__ == "__main__":
                         help="Path to the JSON file containing model parameters.")
     parser.add_argument("--test_samples", type=str,
                         help="Path to the JSON file containing test samples.")
+    parser.add_argument("--key_scheme", type=str, choices=sorted(KEY_SCHEMES), default='short',
+                        help="Naming of the keys in the JSON files: 'short' (wX/bX, inX/outX) or "
+                             "'legacy' (lX_weights/lX_biases, inputX/outputX).")
+    parser.add_argument("--cache", action="store_true",
+                        help="Reuse the program cached in '~/.cache/noir-ml' for unchanged inputs.")
+    parser.add_argument("--no_tests", action="store_true",
+                        help="Generate only the model, without reading the test samples even if given.")
+    parser.add_argument("--compress", action="store_true",
+                        help="Write the program gzip-compressed to '<save_path>.gz'.")
 
     args = parser.parse_args()
 
-    generate_nn_code(args.save_path, args.model_parameters, args.test_samples)
+    # Leave the test samples file unread when only the model is wanted
+    test_samples = None if args.no_tests else args.test_samples
+
+    save_path = generate_nn_code(args.save_path, args.model_parameters, test_samples,
+                                 KEY_SCHEMES[args.key_scheme], use_cache=args.cache,
+                                 compress=args.compress)
 
-    print(f"Generated Noir program: {args.save_path}")
+    print(f"Generated Noir program: {save_path}")
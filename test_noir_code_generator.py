@@ -0,0 +1,264 @@
+import gzip
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import noir_code_generator
+
+EXAMPLES = Path(__file__).parent / 'example_circuits'
+
+# The BN254 scalar field modulus minus one, i.e. how -1 is written as a Field element
+FIELD_MINUS_ONE = 21888242871839275222246405745257275088548364400416034343698204186575808495616
+
+
+@pytest.fixture(params=['ijson', 'json'])
+def json_backend(request, monkeypatch):
+    # Run each test with ijson streaming (when installed) and with the json fallback
+    if request.param == 'ijson':
+        if noir_code_generator.ijson is None:
+            pytest.skip("ijson is not installed")
+    else:
+        monkeypatch.setattr(noir_code_generator, 'ijson', None)
+    return request.param
+
+
+def write_json(path, data):
+    path.write_text(json.dumps(data))
+    return str(path)
+
+
+def generate(tmp_path, model_parameters, test_samples=None):
+    params_file = write_json(tmp_path / 'params.json', model_parameters)
+    samples_file = None if test_samples is None else write_json(tmp_path / 'samples.json', test_samples)
+    save_path = str(tmp_path / 'main.nr')
+    noir_code_generator.generate_nn_code(save_path, params_file, samples_file)
+    return Path(save_path).read_text()
+
+
+@pytest.mark.parametrize('name', ['circle_fc', 'mnist_fc'])
+def test_examples_match_committed_programs(json_backend, tmp_path, name):
+    save_path = str(tmp_path / 'main.nr')
+    training = EXAMPLES / name / 'training'
+    noir_code_generator.generate_nn_code(save_path, str(training / f'{name}_parameters.json'),
+                                         str(training / f'{name}_samples.json'))
+    assert Path(save_path).read_text() == (EXAMPLES / name / 'src' / 'main.nr').read_text()
+
+
+def test_field_sized_test_samples(json_backend, tmp_path):
+    program = generate(tmp_path, {'w1': [1, 2], 'b1': [1]},
+                       {'in1': [FIELD_MINUS_ONE, 2], 'out1': 1, 'in2': [3, 4], 'out2': FIELD_MINUS_ONE})
+    assert f"let sample = [{FIELD_MINUS_ONE}, 2];" in program
+    assert f"assert(main(sample) == {FIELD_MINUS_ONE});" in program
+
+
+def test_non_integer_numbers(json_backend, tmp_path):
+    # Formatted as the floats json.load returns, whichever backend reads the file
+    params_file = tmp_path / 'params.json'
+    params_file.write_text('{"w1": [1.0, 1E+2, 0.1], "b1": [1]}')
+    samples_file = tmp_path / 'samples.json'
+    samples_file.write_text('{"in1": [1.5E+3, 2, -0.25], "out1": 1e-1}')
+    save_path = str(tmp_path / 'main.nr')
+    noir_code_generator.generate_nn_code(save_path, str(params_file), str(samples_file))
+    program = Path(save_path).read_text()
+    assert "global w1: [Field; 3] = [1.0, 100.0, 0.1];" in program
+    assert "let sample = [1500.0, 2, -0.25];" in program
+    assert "assert(main(sample) == 0.1);" in program
+
+
+def test_compressed_program(tmp_path):
+    training = EXAMPLES / 'circle_fc' / 'training'
+    save_path = str(tmp_path / 'main.nr')
+    gz_path = noir_code_generator.generate_nn_code(save_path, str(training / 'circle_fc_parameters.json'),
+                                                   str(training / 'circle_fc_samples.json'), compress=True)
+    assert gz_path == save_path + '.gz'
+    data = Path(gz_path).read_bytes()
+    assert gzip.decompress(data) == (EXAMPLES / 'circle_fc' / 'src' / 'main.nr').read_bytes()
+    # The header names the final program and has no timestamp
+    assert data[3] == gzip.FNAME and data[4:8] == bytes(4)
+    assert data[10:data.index(b'\0', 10)] == b'main.nr'
+
+
+SCANNER_DOCUMENTS = [
+    '{}',
+    ' \n{"w1": [1]} \r\n\t ',
+    '{"w1": [1, -2, 3.5e-1], "b1": []}',
+    '{ "meta" : {"w1": [9, 9], "s": "]}\\"["}, "w1":[\n1,\t2\r\n] , "b1" : [ 1 ] }',
+    '{"w 1": [1], "w\\u0031": [2], "x": "a \\\\ b", "n": null, "t": true, "f": -0.5}',
+    '{"nested": [[1, 2], [3]], "mixed": [1, "2", null], "obj": {"a": [{"b": []}]}}',
+    '{"empty": {}, "a": [1], "end": {}}',
+    '{"w1": [  1 ,\n\n    -2  ,\t3\r\n\n ], "b1": [ ], "x": [ 1.5 , 2 ]}',
+    '{"big": [%d, -%d], "out": %d}' % (FIELD_MINUS_ONE, FIELD_MINUS_ONE, FIELD_MINUS_ONE),
+]
+
+
+def scanned_members(path):
+    # The scanner's members, with the raw arrays decoded for comparison with json.load
+    return [(key, json.loads(f"[{value.text}]") if isinstance(value, noir_code_generator._RawArray) else value)
+            for key, value in noir_code_generator._iter_raw_arrays(path)]
+
+
+@pytest.mark.parametrize('read_size', [1, 7, 1 << 20])
+@pytest.mark.parametrize('document', SCANNER_DOCUMENTS)
+def test_scanner_matches_json(tmp_path, monkeypatch, read_size, document):
+    monkeypatch.setattr(noir_code_generator, '_READ_SIZE', read_size)
+    path = tmp_path / 'doc.json'
+    path.write_text(document)
+    assert scanned_members(str(path)) == list(json.loads(document).items())
+
+
+def test_scanner_copies_number_text(tmp_path):
+    path = tmp_path / 'doc.json'
+    path.write_text('{"w1": [\n  %d,\n  -2,\n  0\n], "b1": [], "x": [1.50, 2]}' % FIELD_MINUS_ONE)
+    members = list(noir_code_generator._iter_raw_arrays(str(path)))
+    assert members == [('w1', noir_code_generator._RawArray(f"{FIELD_MINUS_ONE}, -2, 0", 3)),
+                       ('b1', noir_code_generator._RawArray("", 0)),
+                       ('x', [1.5, 2])]
+
+
+@pytest.mark.parametrize('document', ['', '[1]', '{"w1": [1, 2', '{"w1": [1,, 2]}', '{"w1": [1, 2,]}',
+                                      '{"w1": [1-2]}', '{"w1": [-]}', '{"w1" [1]}', '{"w1": [1]',
+                                      '{"w1": [1 2]}', '{"w1": [1, 2 3, 4]}', '{"w1": [1.5 2]}',
+                                      '{"w1": [1, 2], "b1": [1]} trailing junk', '{} {}', '{"w1": [1]}\n ]'])
+@pytest.mark.parametrize('read_size', [1, 7, 1 << 20])
+def test_scanner_rejects_invalid_json(tmp_path, monkeypatch, read_size, document):
+    monkeypatch.setattr(noir_code_generator, '_READ_SIZE', read_size)
+    path = tmp_path / 'doc.json'
+    path.write_text(document)
+    with pytest.raises(ValueError):
+        list(noir_code_generator._iter_raw_arrays(str(path)))
+
+
+def test_only_top_level_layer_keys(tmp_path):
+    program = generate(tmp_path, {'meta': {'w1': [9, 9], 'b1': [9]}, 'w 1': [8], 'w1': [1, 2], 'b1': [1]})
+    assert program.count("global w1:") == 1
+    assert "global w1: [Field; 2] = [1, 2];" in program
+    assert "global b1: [Field; 1] = [1];" in program
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    cache_dir = tmp_path / 'cache'
+    monkeypatch.setattr(noir_code_generator, 'CACHE_DIR', cache_dir)
+    return cache_dir
+
+
+def generate_cached(tmp_path, model_parameters, **kwargs):
+    params_file = write_json(tmp_path / 'params.json', model_parameters)
+    save_path = str(tmp_path / 'main.nr')
+    noir_code_generator.generate_nn_code(save_path, params_file, use_cache=True, **kwargs)
+    return Path(save_path).read_text()
+
+
+def test_cache_miss_then_hit(tmp_path, cache_dir, monkeypatch):
+    program = generate_cached(tmp_path, {'w1': [1, 2], 'b1': [1]})
+    [entry] = cache_dir.iterdir()
+    assert entry.suffix == '.nr' and entry.read_text() == program
+
+    # A hit copies the cached program without generating it again
+    entry.write_text("cached\n")
+    monkeypatch.setattr(noir_code_generator, '_write_nn_code', None)
+    assert generate_cached(tmp_path, {'w1': [1, 2], 'b1': [1]}) == "cached\n"
+    assert list(cache_dir.iterdir()) == [entry]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['cache', 'main.nr', 'params.json']
+
+
+def test_cache_entry_evicted_during_hit(tmp_path, cache_dir, monkeypatch):
+    program = generate_cached(tmp_path, {'w1': [1, 2], 'b1': [1]})
+    [entry] = cache_dir.iterdir()
+    copy_file = noir_code_generator._copy_file
+
+    def evict_then_copy(src, dst):
+        # Another run evicts the entry right before it is read
+        if src == str(entry):
+            entry.unlink()
+        copy_file(src, dst)
+
+    monkeypatch.setattr(noir_code_generator, '_copy_file', evict_then_copy)
+    assert generate_cached(tmp_path, {'w1': [1, 2], 'b1': [1]}) == program
+    assert entry.read_text() == program
+
+
+def test_cache_off_by_default(tmp_path, cache_dir):
+    generate(tmp_path, {'w1': [1, 2], 'b1': [1]})
+    assert not cache_dir.exists()
+
+
+def test_cache_key_changes_with_inputs(tmp_path, cache_dir):
+    generate_cached(tmp_path, {'w1': [1, 2], 'b1': [1]})
+    generate_cached(tmp_path, {'w1': [1, 3], 'b1': [1]})
+    generate_cached(tmp_path, {'w1': [1, 3], 'b1': [1]}, scheme=noir_code_generator.KeyScheme(input='x{}'))
+    generate_cached(tmp_path, {'w1': [1, 3], 'b1': [1]}, compress=True)
+    assert len(list(cache_dir.iterdir())) == 4
+
+
+def test_cache_evicts_least_recently_used(tmp_path, cache_dir, monkeypatch):
+    monkeypatch.setattr(noir_code_generator, 'CACHE_MAX_ENTRIES', 2)
+    entries = {}
+    for weight in [1, 2, 3]:
+        generate_cached(tmp_path, {'w1': [weight], 'b1': [1]})
+        [entries[weight]] = set(cache_dir.iterdir()) - set(entries.values())
+        os.utime(entries[weight], (weight, weight))  # used in this order
+    assert set(cache_dir.iterdir()) == {entries[2], entries[3]}
+
+    # The hit on w1 = [2] leaves w1 = [3] as the least recently used entry
+    generate_cached(tmp_path, {'w1': [2], 'b1': [1]})
+    generate_cached(tmp_path, {'w1': [4], 'b1': [1]})
+    assert entries[2].exists() and not entries[3].exists()
+    assert len(list(cache_dir.iterdir())) == 2
+
+
+def test_sparse_sample_indices(json_backend, tmp_path):
+    program = generate(tmp_path, {'w1': [1, 2], 'b1': [1]},
+                       {'in7': [5, 6], 'in1': [1, 2], 'out1': 0, 'out7': 1})
+    assert "fn test_main_001()" in program and "fn test_main_007()" in program
+    assert program.count("#[test]") == 2
+
+
+@pytest.mark.parametrize('test_samples, message', [
+    ('{"in1": [1, 2], "out1": 0, "in1": [3, 4]}', "Duplicate key 'in1'"),
+    ('{"in1": [1, 2], "out1": 0, "out1": 1}', "Duplicate key 'out1'"),
+    ('{"in1": [1, 2], "out1": 0, "in2": [3, 4], "out3": 1}', "Missing keys out2, in3"),
+])
+def test_invalid_test_samples(json_backend, tmp_path, test_samples, message):
+    params_file = write_json(tmp_path / 'params.json', {'w1': [1, 2], 'b1': [1]})
+    samples_file = tmp_path / 'samples.json'
+    samples_file.write_text(test_samples)
+    with pytest.raises(ValueError, match=message):
+        noir_code_generator.generate_nn_code(str(tmp_path / 'main.nr'), params_file, str(samples_file))
+
+
+@pytest.mark.parametrize('model_parameters, message', [
+    ('{"w1": [1, 2], "b1": [1], "w1": [3, 4]}', "Duplicate key 'w1'"),
+    ('{"w1": [1, 2], "b1": [1], "w2": [1], "b1": [2]}', "Duplicate key 'b1'"),
+    ('{"w2": [1], "b2": [1]}', "No weights and biases for layer 1"),
+])
+def test_invalid_model_parameters(tmp_path, model_parameters, message):
+    params_file = tmp_path / 'params.json'
+    params_file.write_text(model_parameters)
+    with pytest.raises(ValueError, match=message):
+        noir_code_generator.generate_nn_code(str(tmp_path / 'main.nr'), str(params_file))
+    assert not (tmp_path / 'main.nr').exists()
+
+
+def test_legacy_key_scheme(json_backend, tmp_path):
+    params_file = write_json(tmp_path / 'params.json', {'l1_weights': [1, 2], 'l1_biases': [1], 'w1': [9],
+                                                        'l2_weights': [3], 'l2_biases': [4]})
+    samples_file = write_json(tmp_path / 'samples.json', {'input1': [1, 2], 'output1': 0, 'in2': [3, 4]})
+    save_path = str(tmp_path / 'main.nr')
+    noir_code_generator.generate_nn_code(save_path, params_file, samples_file, noir_code_generator.LEGACY_SCHEME)
+    program = Path(save_path).read_text()
+    # The globals keep their w/b names whatever the keys in the JSON files
+    assert "global w1: [Field; 2] = [1, 2];\nglobal b1: [Field; 1] = [1];" in program
+    assert "global w2: [Field; 1] = [3];\nglobal b2: [Field; 1] = [4];" in program
+    assert "let output = arg_max(fc(output, w2, b2));" in program
+    assert "fn test_main_001()" in program and program.count("#[test]") == 1
+
+    cli_path = tmp_path / 'cli.nr'
+    subprocess.run([sys.executable, noir_code_generator.__file__, '--save_path', str(cli_path),
+                    '--model_parameters', params_file, '--test_samples', samples_file,
+                    '--key_scheme', 'legacy'], check=True, capture_output=True)
+    assert cli_path.read_text() == program